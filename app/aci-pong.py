@@ -1,24 +1,27 @@
 #!/usr/bin/env python3
 """
 This script spawns Azure Container Instances as one-off jobs to measure the
-response time of defined webpages. It picks a random region from a list of viable
-regions for each measurement. Once the job completes, it retrieves logs (which the
-measurement container is expected to output as a number indicating ms elapsed),
-and then records that as a Prometheus metric.
+response time of defined webpages. It assigns the webpages round-robin to a list
+of viable regions, rotating the assignment every cycle, and spawns one job per region
+that measures all webpages assigned to it with curl. Once the job completes, it
+retrieves logs (which curl is told to write as one line of timings per webpage),
+and then records those as Prometheus metrics.
 """
 
 import os
 import time
-import random
+import itertools
 import uuid
+import base64
+import asyncio
 import logging
-from datetime import datetime
+import threading
 
 import requests
 
 # Azure container instance SDK
-from azure.identity import DefaultAzureCredential
-from azure.mgmt.containerinstance import ContainerInstanceManagementClient
+from azure.identity.aio import DefaultAzureCredential
+from azure.mgmt.containerinstance.aio import ContainerInstanceManagementClient
 from azure.mgmt.containerinstance.models import (
     ContainerGroup,
     Container,
@@ -29,15 +32,47 @@ from azure.mgmt.containerinstance.models import (
     ImageRegistryCredential,
     Port,
     ContainerPort,
+    Volume,
+    VolumeMount,
 )
 
 # Prometheus client
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from prometheus_client.registry import Collector
 
 # Setup basic logging
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# ---------------------------
+# Prometheus metrics
+# ---------------------------
+
+class ResponseTimeCollector(Collector):
+    """
+    Holds the latest response time per (target, region) in a plain dict and only
+    builds the webpage_response_time_ms gauge samples when Prometheus scrapes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._response_times = {}
+
+    def set(self, target, region, value):
+        """Records the latest response time (ms) for a target measured from a region."""
+        with self._lock:
+            self._response_times[(target, region)] = value
+
+    def collect(self):
+        with self._lock:
+            response_times = list(self._response_times.items())
+        gauge = GaugeMetricFamily("webpage_response_time_ms", "Response time in milliseconds",
+                                  labels=["target", "region"])
+        for (target, region), value in response_times:
+            gauge.add_metric([target, region], value)
+        yield gauge
+
 # ---------------------------
 # Global Configurations
 # ---------------------------
@@ -50,9 +85,15 @@ if not AZURE_SUBSCRIPTION_ID:
 # The resource group in which to create container instances
 AZURE_RESOURCE_GROUP = os.environ.get("AZURE_RESOURCE_GROUP", "my-resource-group")
 # The container image that performs the measurement.
-# This image should contain a script that accepts the URL as argument
-# and outputs (logs) a single floating-point number representing response time (ms)
-MEASURE_IMAGE = os.environ.get("MEASURE_IMAGE", "myregistry.azurecr.io/webpage-measure:latest")
+# This image must provide curl 7.67 or later (--parallel needs 7.66, --no-progress-meter
+# needs 7.67); it is run with a generated curl config file that writes one timing line per URL.
+MEASURE_IMAGE = os.environ.get("MEASURE_IMAGE", "docker.io/curlimages/curl:8.10.1")
+
+# Maximum number of seconds a single measurement request may take
+MEASURE_REQUEST_TIMEOUT = int(os.environ.get("MEASURE_REQUEST_TIMEOUT", "30"))
+
+# Maximum number of redirects followed per measurement (same default as requests)
+MEASURE_MAX_REDIRECTS = int(os.environ.get("MEASURE_MAX_REDIRECTS", "30"))
 
 # If image requires credentials, these environment variables (or similar) must be set
 # For this example, we assume public image or that DefaultAzureCredential handles authentication.
@@ -62,15 +103,19 @@ MEASURE_IMAGE = os.environ.get("MEASURE_IMAGE", "myregistry.azurecr.io/webpage-m
 WEBPAGES_CONFIG_PATH = os.environ.get("WEBPAGES_CONFIG_PATH", "/etc/webpages/webpages.txt")
 
 # A list of viable Azure regions
-AZURE_REGIONS = [
+AZURE_REGIONS = (
     "eastus", "westus", "centralus", "northeurope", "westeurope",
     "southeastasia", "eastasia"
-]
+)
+
+# Offset into AZURE_REGIONS for the round-robin assignment, advanced every cycle
+# so each webpage is measured from every region over time.
+_REGION_OFFSETS = itertools.cycle(range(len(AZURE_REGIONS)))
 
-# Prometheus gauge that will hold the response time metric
+# Prometheus collector that will hold the response time metric
 # Labels: target (the webpage URL) and region (the Azure region used for measurement)
-webpage_response_time = Gauge("webpage_response_time_ms", "Response time in milliseconds",
-                              ["target", "region", "timestamp"])
+webpage_response_time = ResponseTimeCollector()
+REGISTRY.register(webpage_response_time)
 
 # Delay (in seconds) between measurement cycles
 MEASUREMENT_INTERVAL = int(os.environ.get("MEASUREMENT_INTERVAL", "60"))
@@ -78,162 +123,333 @@ MEASUREMENT_INTERVAL = int(os.environ.get("MEASUREMENT_INTERVAL", "60"))
 # Maximum number of seconds to wait for an ACI container group job to finish
 ACR_TIMEOUT = int(os.environ.get("ACR_TIMEOUT", "180"))
 
+# Extra log lines fetched per job beyond the expected curl output
+LOG_TAIL_MARGIN = 10
+
+# Maximum number of ACI container groups (one per region) in flight at once
+MAX_CONCURRENT_MEASUREMENTS = int(os.environ.get("MAX_CONCURRENT_MEASUREMENTS", "16"))
+
+# Maximum delay (in seconds) between status polls of a container group.
+# Polling starts at POLL_INITIAL_DELAY and backs off exponentially up to this value.
+POLL_INTERVAL = float(os.environ.get("POLL_INTERVAL", "5"))
+POLL_INITIAL_DELAY = float(os.environ.get("POLL_INITIAL_DELAY", "0.5"))
+POLL_BACKOFF_FACTOR = 1.5
+
+# Azure credential and ACI client, created on first use and kept for the process lifetime
+# so the AAD token cache and the HTTP connection pool survive across cycles.
+_CREDENTIAL = None
+_ACI_CLIENT = None
+
+# Resources of the measurement container; identical for every job, so built once and shared
+_CONTAINER_RESOURCES = ResourceRequirements(requests=ResourceRequests(memory_in_gb=0.1, cpu=0.2))
+
+# Background deletions of container groups that have not finished yet
+_PENDING_DELETES = set()
+
+# Parsed webpages list as (path, st_mtime_ns, urls); re-read only when the file changes
+_WEBPAGES_CACHE = (None, None, [])
+
 # ---------------------------
 # Helper functions
 # ---------------------------
 
+def get_aci_client():
+    """Returns the shared ACI management client, creating it on first use."""
+    global _CREDENTIAL, _ACI_CLIENT
+    if _ACI_CLIENT is None:
+        _CREDENTIAL = DefaultAzureCredential()
+        _ACI_CLIENT = ContainerInstanceManagementClient(_CREDENTIAL, AZURE_SUBSCRIPTION_ID)
+    return _ACI_CLIENT
+
+async def close_aci_client():
+    """Closes the shared ACI management client and its credential, if created."""
+    global _CREDENTIAL, _ACI_CLIENT
+    if _ACI_CLIENT is not None:
+        await _ACI_CLIENT.close()
+        await _CREDENTIAL.close()
+        _CREDENTIAL = None
+        _ACI_CLIENT = None
+
 def read_webpages(config_path):
-    """Reads a list of webpages from a given file."""
+    """
+    Reads a list of webpages from a given file.
+    The parsed list is cached and only re-read when the file's modification time changes.
+    """
+    global _WEBPAGES_CACHE
     try:
+        mtime_ns = os.stat(config_path).st_mtime_ns
+        cached_path, cached_mtime_ns, cached_urls = _WEBPAGES_CACHE
+        if cached_path == config_path and cached_mtime_ns == mtime_ns:
+            return list(cached_urls)
         with open(config_path, "r") as f:
-            urls = [line.strip() for line in f.readlines() if line.strip()]
-        return urls
+            urls = [url for url in (line.strip() for line in f) if url]
+        _WEBPAGES_CACHE = (config_path, mtime_ns, urls)
+        return list(urls)
     except Exception as e:
-        logger.error(f"Error reading {config_path}: {e}")
+        logger.error("Error reading %s: %s", config_path, e)
         return []
 
-def create_container_group(client, region, url):
+def build_curl_config(urls):
+    """
+    Builds a curl config file that fetches each URL as its own transfer, following
+    redirects to the final page, and writes
+    "<url>\t<http code>\t<time_pretransfer>\t<time_total>" (times in seconds) per URL.
+    The http code is the one of the final page.
     """
-    Creates an ACI container group that runs a one-shot container to measure the response time.
-    Returns the name of the container group that was created.
+    def quote(value):
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    sections = []
+    for url in urls:
+        # "%" starts a variable in --write-out, so it is doubled for the literal URL.
+        write_out = url.replace("%", "%%") + "\\t%{http_code}\\t%{time_pretransfer}\\t%{time_total}\\n"
+        sections.append("\n".join([
+            f"url = {quote(url)}",
+            'output = "/dev/null"',
+            "location",
+            f"max-redirs = {MEASURE_MAX_REDIRECTS}",
+            f"max-time = {MEASURE_REQUEST_TIMEOUT}",
+            f"write-out = {quote(write_out)}",
+        ]))
+    return "\nnext\n".join(sections) + "\n"
+
+def new_container_group_name():
+    """Returns a unique name for a measurement container group."""
+    return f"measure-{uuid.uuid4().hex[:8]}"
+
+async def create_container_group(client, group_name, region, urls):
+    """
+    Starts creating an ACI container group that runs a one-shot curl container to measure
+    the response times of the given URLs. The URLs are mounted into the container as a
+    curl config file.
+    Returns as soon as ARM has accepted the request; wait_for_container_completion()
+    then tracks provisioning and the container run with a single backoff loop.
     """
-    group_name = f"measure-{uuid.uuid4().hex[:8]}"
     container_name = "measure"
-    command = ["python", "/app/measure.py", "--url", url]
+    # --silent would not hide the --parallel progress meter, so it is disabled explicitly.
+    command = ["curl", "--parallel", "--no-progress-meter", "--config", "/cfg/curl.cfg"]
+
+    # Secret volume values must be base64 encoded.
+    curl_config = base64.b64encode(build_curl_config(urls).encode("utf-8")).decode("ascii")
+    volume = Volume(name="cfg", secret={"curl.cfg": curl_config})
+    volume_mount = VolumeMount(name="cfg", mount_path="/cfg", read_only=True)
 
-    container_resource_requests = ResourceRequests(memory_in_gb=0.1, cpu=0.2)
-    container_resources = ResourceRequirements(requests=container_resource_requests)
     container = Container(name=container_name,
                           image=MEASURE_IMAGE,
                           command=command,
-                          resources=container_resources)
+                          resources=_CONTAINER_RESOURCES,
+                          volume_mounts=[volume_mount])
 
     group = ContainerGroup(
         location=region,
         containers=[container],
         os_type=OperatingSystemTypes.linux,
         restart_policy=ContainerGroupRestartPolicy.never,
+        volumes=[volume],
     )
 
-    logger.info(f"Creating container group {group_name} in region {region} for URL {url}")
-    client.container_groups.begin_create_or_update(
+    logger.info("Creating container group %s in region %s for %s URLs", group_name, region, len(urls))
+    await client.container_groups.begin_create_or_update(
         AZURE_RESOURCE_GROUP,
         group_name,
-        group
-    ).result()  # Wait for creation to finish
-    return group_name
+        group,
+    )
 
-def wait_for_container_completion(client, container_group_name, container_name="measure"):
+async def wait_for_container_completion(client, container_group_name, deadline, container_name="measure"):
     """
-    Polls the container instance until it finishes executing (or a timeout is reached).
+    Polls the container group with exponential backoff, from the moment its creation
+    was accepted, until the container finishes executing (or the deadline, a
+    time.monotonic() value, is reached).
     Returns True if completed; False if timed out.
+    A failed provisioning raises right away instead of being polled until the deadline.
     """
-    start_time = time.time()
-    while time.time() - start_time < ACR_TIMEOUT:
-        cg = client.container_groups.get(AZURE_RESOURCE_GROUP, container_group_name)
+    delay = POLL_INITIAL_DELAY
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * POLL_BACKOFF_FACTOR, POLL_INTERVAL)
+        cg = await client.container_groups.get(AZURE_RESOURCE_GROUP, container_group_name)
+        if (cg.provisioning_state or "").lower() == "failed":
+            raise RuntimeError(f"Provisioning of container group {container_group_name} failed")
         if cg.containers[0].instance_view:
             container_state = cg.containers[0].instance_view.current_state.state.lower()
         else:
             container_state = ""
-        logger.debug(f"Container {container_group_name} state: {container_state}")
+        logger.debug("Container %s state: %s", container_group_name, container_state)
         if container_state in ("terminated", "exited"):
             return True
-        time.sleep(5)
-    return False
 
-def get_container_logs(client, container_group_name, container_name="measure"):
+async def get_container_logs(client, container_group_name, container_name="measure", tail=None):
     """
     Retrieves the logs from the finished container.
+    If tail is given, only the last tail lines are retrieved.
     """
-    logs = client.containers.list_logs(AZURE_RESOURCE_GROUP, container_group_name, container_name)
+    logs = await client.containers.list_logs(AZURE_RESOURCE_GROUP, container_group_name, container_name,
+                                             tail=tail)
     return logs.content
 
 def delete_container_group(client, container_group_name):
     """
     Deletes a container group to cleanup resources.
+    The deletion runs in the background and is tracked in _PENDING_DELETES,
+    so the caller does not wait for it.
     """
+    _PENDING_DELETES.add(asyncio.create_task(_delete_container_group(client, container_group_name)))
+
+async def _delete_container_group(client, container_group_name):
+    """Deletes the group and waits for the deletion to finish, logging the outcome."""
     try:
-        client.container_groups.begin_delete(AZURE_RESOURCE_GROUP, container_group_name)
-        logger.info(f"Deleted container group {container_group_name}")
+        poller = await client.container_groups.begin_delete(AZURE_RESOURCE_GROUP, container_group_name)
+        await poller.result()
+        logger.info("Deleted container group %s", container_group_name)
     except Exception as e:
-        logger.error(f"Error deleting container group {container_group_name}: {e}")
+        logger.error("Error deleting container group %s: %s", container_group_name, e)
 
-def parse_response_time(log_content):
+def prune_pending_deletes():
+    """Forgets background deletions that have finished."""
+    global _PENDING_DELETES
+    _PENDING_DELETES = {task for task in _PENDING_DELETES if not task.done()}
+
+def parse_response_times(log_content):
     """
-    Parses log output and returns the response time (as float).
-    This function assumes that the measurement container prints a single line
-    that is just a float (milliseconds). Customize parsing if needed.
+    Parses log output and returns the response times (in milliseconds) keyed by URL.
+    This function assumes the line format written by build_curl_config(). The response
+    time is time_total minus time_pretransfer. When curl follows redirects it sums
+    time_pretransfer over every hop, so the result excludes DNS resolution and TCP/TLS
+    setup of all hops and keeps the server and transfer time of all hops (time_redirect
+    is part of time_total, but its setup share is subtracted again). Only a 2xx final
+    page counts as a result; failed requests (HTTP code 000, 3xx left after max-redirs
+    or without a Location, 4xx, 5xx) and lines not matching this format (e.g. error
+    messages) are skipped.
     """
+    response_times = {}
     try:
-        for line in log_content.splitlines():
+        for line in log_content.split("\n"):
+            fields = line.strip().rsplit("\t", 3)
+            if len(fields) != 4:
+                continue
+            url, http_code, time_pretransfer, time_total = fields
             try:
-                value = float(line.strip())
-                return value
+                if not 200 <= int(http_code) < 300:
+                    continue
+                response_times[url] = (float(time_total) - float(time_pretransfer)) * 1000
             except ValueError:
                 continue
     except Exception as e:
-        logger.error(f"Error parsing log content: {e}")
-    return None
+        logger.error("Error parsing log content: %s", e)
+    return response_times
 
 # ---------------------------
 # Main measurement loop
 # ---------------------------
 
-def run_measurement_cycle():
+async def measure_region(client, semaphore, region, urls):
+    """
+    Runs a measurement of the given webpages from a single region.
+    Spawns one ACI job for all webpages and records the metrics.
+    """
+    async with semaphore:
+        # The name is chosen up front so a creation abandoned mid-request can still be cleaned up.
+        container_group_name = new_container_group_name()
+        # ACR_TIMEOUT bounds the whole job, including retries of the creation request.
+        deadline = time.monotonic() + ACR_TIMEOUT
+        try:
+            try:
+                await asyncio.wait_for(
+                    create_container_group(client, container_group_name, region, urls),
+                    timeout=max(0, deadline - time.monotonic()),
+                )
+                completed = await wait_for_container_completion(client, container_group_name, deadline)
+            except asyncio.TimeoutError:
+                completed = False
+            if not completed:
+                logger.error("Timeout waiting for container group %s to finish.", container_group_name)
+                return
+
+            # With --no-progress-meter, curl prints one result line per URL plus a single
+            # "curl: (N) ..." line per failed transfer, so the results fit in 2 lines per URL.
+            # A few extra lines keep a stray warning from pushing a result out of the tail.
+            log_content = await get_container_logs(client, container_group_name,
+                                                   tail=2 * len(urls) + LOG_TAIL_MARGIN)
+            response_times = parse_response_times(log_content)
+            for url in urls:
+                response_time_ms = response_times.get(url)
+                if response_time_ms is not None:
+                    logger.info("Measured %.2fms for %s from %s at %.3f", response_time_ms, url, region, time.time())
+                    webpage_response_time.set(url, region, response_time_ms)
+                else:
+                    logger.error("Could not parse response time for %s in container group %s", url, container_group_name)
+
+        except Exception as exc:
+            logger.error("Error running measurement for %s URLs from region %s: %s", len(urls), region, exc)
+        finally:
+            try:
+                delete_container_group(client, container_group_name)
+            except Exception as cleanup_error:
+                logger.error("Cleanup error for container group %s: %s", container_group_name, cleanup_error)
+
+async def run_measurement_cycle():
     """
     Runs a measurement cycle for each webpage defined.
-    Spawns an ACI job for each target in a random region and records the metric.
+    Webpages are assigned round-robin to the regions, and all webpages of a region are
+    measured by a single ACI job. The jobs run concurrently, bounded by
+    MAX_CONCURRENT_MEASUREMENTS, so a cycle takes roughly as long as its slowest job.
     """
     webpages = read_webpages(WEBPAGES_CONFIG_PATH)
     if not webpages:
         logger.error("No webpages defined to monitor.")
         return
 
-    credential = DefaultAzureCredential()
-    aci_client = ContainerInstanceManagementClient(credential, AZURE_SUBSCRIPTION_ID)
-
-    for url in webpages:
-        container_group_name = ""  # initialize early for cleanup handling
-        region = random.choice(AZURE_REGIONS)
-        try:
-            container_group_name = create_container_group(aci_client, region, url)
-            completed = wait_for_container_completion(aci_client, container_group_name)
-            if not completed:
-                logger.error(f"Timeout waiting for container group {container_group_name} to finish.")
-                continue
-
-            log_content = get_container_logs(aci_client, container_group_name)
-            response_time_ms = parse_response_time(log_content)
-            if response_time_ms is not None:
-                # Build a basic UTC timestamp and append "Z" to indicate UTC.
-                timestamp = datetime.now().isoformat()
-                logger.info(f"Measured {response_time_ms}ms for {url} from {region}")
-                webpage_response_time.labels(target=url, region=region, timestamp=timestamp).set(response_time_ms)
-            else:
-                logger.error(f"Could not parse response time for {url} in container group {container_group_name}")
-
-        except Exception as exc:
-            logger.error(f"Error running measurement for {url} from region {region}: {exc}")
-        finally:
-            if container_group_name:
-                try:
-                    delete_container_group(aci_client, container_group_name)
-                except Exception as cleanup_error:
-                    logger.error(f"Cleanup error for container group {container_group_name}: {cleanup_error}")
+    offset = next(_REGION_OFFSETS)
+    webpages_by_region = {}
+    for i, url in enumerate(webpages):
+        region = AZURE_REGIONS[(offset + i) % len(AZURE_REGIONS)]
+        webpages_by_region.setdefault(region, []).append(url)
+
+    aci_client = get_aci_client()
+    semaphore = asyncio.Semaphore(max(1, MAX_CONCURRENT_MEASUREMENTS))
+    results = await asyncio.gather(
+        *(measure_region(aci_client, semaphore, region, urls) for region, urls in webpages_by_region.items()),
+        return_exceptions=True,
+    )
+    for region, result in zip(webpages_by_region, results):
+        if isinstance(result, BaseException):
+            logger.error("Unexpected error measuring from region %s: %s", region, result)
 
 # ---------------------------
 # Main runner
 # ---------------------------
 
+async def main_loop():
+    # Cycles start on a fixed MEASUREMENT_INTERVAL grid instead of sleeping a fixed
+    # time after each cycle, so the start times do not drift by the cycle duration.
+    next_start = time.monotonic()
+    try:
+        while True:
+            logger.info("Starting new measurement cycle")
+            await run_measurement_cycle()
+            prune_pending_deletes()
+            next_start += MEASUREMENT_INTERVAL
+            now = time.monotonic()
+            if next_start < now and MEASUREMENT_INTERVAL > 0:
+                # The cycle overran; skip the missed ticks instead of running back to back.
+                missed = (now - next_start) // MEASUREMENT_INTERVAL + 1
+                next_start += missed * MEASUREMENT_INTERVAL
+            delay = max(0, next_start - now)
+            logger.info("Measurement cycle completed. Sleeping for %.1f seconds.", delay)
+            await asyncio.sleep(delay)
+    finally:
+        # Let outstanding deletions finish before the client they use is closed.
+        await asyncio.gather(*_PENDING_DELETES, return_exceptions=True)
+        await close_aci_client()
+
 def main():
     start_http_server(8000)
     logger.info("Prometheus metrics server started on port 8000")
 
-    while True:
-        logger.info("Starting new measurement cycle")
-        run_measurement_cycle()
-        logger.info(f"Measurement cycle completed. Sleeping for {MEASUREMENT_INTERVAL} seconds.")
-        time.sleep(MEASUREMENT_INTERVAL)
+    asyncio.run(main_loop())
 
 if __name__ == '__main__':
     main()
\ No newline at end of file